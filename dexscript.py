@@ -1,19 +1,33 @@
+import asyncio
 import base64
+import csv
+import gzip
+import io
+import json
 import logging
 import os
 import re
+import socket
+import time
 import traceback
+import uuid
+from collections import deque
+from collections.abc import Callable
 from dataclasses import dataclass
 from dataclasses import field as datafield
+from datetime import date, datetime
+from decimal import Decimal
 from difflib import get_close_matches
 from enum import Enum
+from functools import partial
 from pathlib import Path
 from typing import Any
 
 import discord
-import requests
-from dateutil.parser import parse as parse_date
 from discord.ext import commands
+from tortoise import connections
+from tortoise.functions import Avg, Count, Max, Min, Sum
+from tortoise.transactions import in_transaction
 
 dir_type = "ballsdex" if os.path.isdir("ballsdex") else "carfigures"
 
@@ -36,6 +50,8 @@ __version__ = "0.4.3.2"
 
 START_CODE_BLOCK_RE = re.compile(r"^((```sql?)(?=\s)|(```))")
 FILENAME_RE = re.compile(r"^(.+)(\.\S+)$")
+FLAG_RE = re.compile(r"^-([a-zA-Z]+)(?:\s+(.*))?$")
+RUN_FLAGS_RE = re.compile(r"^((?:-[a-zA-Z]+\s+)*)(.*)$", re.DOTALL)
 
 MODELS = {
     "guildconfig": [GuildConfig, "ID"],
@@ -45,13 +61,85 @@ MODELS = {
     "special": [Special, "NAME"],
 }
 
+# The number of positional values each statement accepts, including its verb.
+ARITY = {
+    "push": (1, 2),
+    "create": (3, 4),
+    "delete": (3, 3),
+    "update": (4, 5),
+    "view": (3, 4),
+    "list": (1, 3),
+    "file": (3, 3),
+    "show": (2, 2),
+    "count": (2, 3),
+    "sum": (3, 3),
+    "avg": (3, 3),
+    "min": (3, 3),
+    "max": (3, 3),
+    "snapshot": (2, len(MODELS) + 1),
+    "diff": (2, 2),
+    "restore": (2, 2),
+}
+
+# The flags each statement accepts. Other values starting with `-` are kept as arguments.
+FLAGS = {
+    "push": ["clear"],
+    "view": ["depth"],
+    "list": ["yields", "fields", "where", "limit"],
+    "count": ["where", "group"],
+    "sum": ["where", "group"],
+    "avg": ["where", "group"],
+    "min": ["where", "group"],
+    "max": ["where", "group"],
+}
+
+COMPARISON_LOOKUPS = ["not", "gt", "gte", "lt", "lte"]
+
+AGGREGATES = {
+    "count": Count,
+    "sum": Sum,
+    "avg": Avg,
+    "min": Min,
+    "max": Max,
+}
+
 SETTINGS = {
     "DEBUG": False,
     "OUTDATED-WARNING": True,
     "REFERENCE": "main",
+    "JOB-WORKERS": 2,
+    "CACHE-BUS": "local",
+}
+
+BUS_CHANNEL = "dexscript_cache"
+BUS_SOCKET_DIRECTORY = Path("/tmp/dexscript-bus")
+BUS_RECONNECT_DELAY = 60
+
+JOB_HISTORY = 50
+
+COMPILE_CACHE_SIZE = 64
+
+SNAPSHOT_DIRECTORY = Path("./dexscript-snapshots")
+SNAPSHOT_EXTENSION = ".jsonl.gz"
+SNAPSHOT_BATCH_SIZE = 1000
+
+# The attribute of the bot that holds runtime state while DexScript is reloading.
+STATE_ATTRIBUTE = "_dexscript_state"
+
+# Discord's per-channel rate-limit buckets, as (requests, seconds).
+RATE_LIMITS = {
+    "message": (5, 5.0),
+    "reaction": (1, 0.25),
 }
 
+MESSAGE_LIMIT = 2000
+
+ROW_PAGE_SIZE = 10
+ROW_PAGE_LIMIT = 25
+
 dex_yields = []
+identifier_index = {}
+compiled_scripts = {}
 
 
 class Types(Enum):
@@ -72,6 +160,13 @@ class CodeStatus(Enum):
     FAILURE = 1
 
 
+class JobStatus(Enum):
+    QUEUED = 0
+    RUNNING = 1
+    SUCCESS = 2
+    FAILURE = 3
+
+
 class DexScriptError(Exception):
     pass
 
@@ -101,6 +196,17 @@ def in_list(list_attempt, index):
         return False
 
 
+def format_identifiers(identifiers):
+    return ", ".join(f"`{x}`" for x in identifiers)
+
+
+def format_missing(missing):
+    if not missing:
+        return ""
+
+    return "\nSkipped:\n" + "\n".join(f"- {x}" for x in missing)
+
+
 @dataclass
 class Value:
     name: Any
@@ -110,6 +216,18 @@ class Value:
     def __str__(self):
         return str(self.name)
 
+    @property
+    def text(self) -> str:
+        """
+        The token as it was written, even when it names a model, such as `REGIME` used as
+        an attribute of a ball.
+        """
+
+        if self.type == Types.MODEL and in_list(self.extra_data, 1):
+            return self.extra_data[1]
+
+        return str(self.name)
+
 
 @dataclass
 class Yield:
@@ -124,246 +242,1954 @@ class Yield:
             (x for x in dex_yields if (x.model, x.identifier.name) == (model, identifier)), None
         )
 
+    @staticmethod
+    def names(model) -> set[str]:
+        return {str(x.identifier.name) for x in dex_yields if x.model == model}
 
-class Methods:
-    def __init__(self, parser, ctx, args: list[Value]):
-        self.ctx = ctx
-        self.args = args
 
-        self.parser = parser
+@dataclass
+class Output:
+    callback: Callable
+    bucket: str
+    content: str | None = None
+    kwargs: dict = datafield(default_factory=dict)
+    futures: list = datafield(default_factory=list)
+
+    def can_merge(self, other):
+        if self.kwargs or other.kwargs or self.content is None or other.content is None:
+            return False
 
-    async def push(self):
-        global dex_yields
+        return (
+            self.callback == other.callback
+            and len(self.content) + len(other.content) + 1 <= MESSAGE_LIMIT
+        )
 
-        if in_list(self.args, 1) and self.args[1].name.lower() == "-clear":
-            dex_yields = []
 
-            await self.ctx.send("Cleared yield cache.")
-            return
+class OutputQueue:
+    """
+    Sends DexScript output in order through a queue per channel.
 
-        for index, yield_object in enumerate(dex_yields, start=1):
-            if in_list(self.args, 1) and int(self.args[1].name) >= index:
-                break
+    Consecutive text messages are merged, and Discord's rate-limit buckets are tracked
+    locally, so scripts never wait on a 429.
+    """
 
-            match yield_object.type:
-                case YieldType.CREATE_MODEL:
-                    await yield_object.model.create(**yield_object.value)
+    def __init__(self):
+        self.pending: dict[int, deque[Output]] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+        self.buckets: dict[tuple[int, str], deque[float]] = {}
 
-        plural = "" if len(dex_yields) == 1 else "s"
-        number = self.args[1].name if in_list(self.args, 1) else len(dex_yields)
+    def submit(self, channel_id: int, output: Output) -> asyncio.Future:
+        """
+        Queues an output and returns a future that resolves once it has been sent.
+        """
 
-        await self.ctx.send(f"Pushed `{number}` yield{plural}.")
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda x: x.cancelled() or x.exception())
 
-        dex_yields = []
+        output.futures.append(future)
 
-    async def create(self):
-        result = await self.parser.create_model(
-            self.args[1].name, self.args[2], self.args[3] if in_list(self.args, 3) else False
-        )
+        self.pending.setdefault(channel_id, deque()).append(output)
 
-        suffix = ""
+        if channel_id not in self.workers:
+            self.workers[channel_id] = asyncio.create_task(self.worker(channel_id))
 
-        if result is not None:
-            suffix = " and yielded it until `push`"
-            dex_yields.append(result)
+        return future
 
-        await self.ctx.send(f"Created `{self.args[2]}`{suffix}")
+    def send(self, messageable, content=None, **kwargs) -> asyncio.Future:
+        channel_id = messageable.channel.id if hasattr(messageable, "channel") else 0
 
-    async def delete(self):
-        returned_model = await self.parser.get_model(self.args[1], self.args[2].name)
+        return self.submit(channel_id, Output(messageable.send, "message", content, kwargs))
 
-        await returned_model.delete()
+    def add_reaction(self, message: discord.Message, emoji: str) -> asyncio.Future:
+        output = Output(partial(message.add_reaction, emoji), "reaction")
 
-        await self.ctx.send(f"Deleted `{self.args[2]}`")
+        return self.submit(message.channel.id, output)
 
-    async def update(self):
-        found_yield = Yield.get(self.args[1].name, self.args[2].name)
+    async def wait_for_bucket(self, channel_id: int, bucket: str):
+        requests_allowed, period = RATE_LIMITS[bucket]
+        timestamps = self.buckets.setdefault((channel_id, bucket), deque())
 
-        new_attribute = None
+        while timestamps and time.monotonic() - timestamps[0] >= period:
+            timestamps.popleft()
+
+        if len(timestamps) >= requests_allowed:
+            await asyncio.sleep(period - (time.monotonic() - timestamps[0]))
+            timestamps.popleft()
+
+        timestamps.append(time.monotonic())
+
+    async def worker(self, channel_id: int):
+        pending = self.pending[channel_id]
+
+        try:
+            while pending:
+                await self.wait_for_bucket(channel_id, pending[0].bucket)
+
+                output = pending.popleft()
+
+                while pending and output.can_merge(pending[0]):
+                    merged = pending.popleft()
+
+                    output.content = f"{output.content}\n{merged.content}"
+                    output.futures += merged.futures
+
+                try:
+                    if output.content is None:
+                        result = await output.callback(**output.kwargs)
+                    else:
+                        result = await output.callback(output.content, **output.kwargs)
+                except Exception as error:
+                    if isinstance(error, discord.HTTPException) and error.status == 429:
+                        pending.appendleft(output)
+                        await asyncio.sleep(getattr(error, "retry_after", 1.0))
+                        continue
+
+                    log.error("Failed to send DexScript output", exc_info=error)
+
+                    for future in output.futures:
+                        future.set_exception(error)
+
+                    continue
+
+                for future in output.futures:
+                    future.set_result(result)
+        finally:
+            del self.workers[channel_id]
 
-        if self.ctx.message.attachments != []:
-            image_path = await save_file(self.ctx.message.attachments[0])
-            new_attribute = Value(f"/{image_path}", Types.STRING)
-        else:
-            new_attribute = self.args[4]
 
-        update_message = f"`{self.args[2]}'s` {self.args[3]} to `{new_attribute.name}`"
+@dataclass
+class CacheEvent:
+    model: str
+    pk: Any
+    op: str
+    origin: str = ""
+
+    def dump(self) -> bytes:
+        return json.dumps(
+            {"model": self.model, "pk": self.pk, "op": self.op, "origin": self.origin},
+            default=str,
+        ).encode("UTF-8")
+
+    @staticmethod
+    def load(data: bytes | str):
+        return CacheEvent(**json.loads(data))
+
+
+def apply_event(event: CacheEvent):
+    """
+    Drops every cache entry made stale by a write.
+    """
+
+    identifier_index.pop(event.model, None)
 
-        if found_yield is None:
-            returned_model = await self.parser.get_model(self.args[1], self.args[2].name)
 
-            setattr(returned_model, self.args[3].name.lower(), new_attribute.name)
+class InvalidationBus:
+    """
+    Broadcasts cache invalidation events between processes running DexScript.
+
+    This backend is local only; subclasses implement the actual transports.
+    """
+
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex}"
 
-            await returned_model.save()
+    async def start(self):
+        pass
 
-            await self.ctx.send(f"Updated {update_message}")
+    async def stop(self):
+        pass
+
+    async def send(self, data: bytes):
+        pass
+
+    async def publish(self, event: CacheEvent):
+        event.origin = self.origin
+
+        try:
+            await self.send(event.dump())
+        except Exception:
+            log.exception("Failed to publish DexScript cache event")
 
+    def receive(self, data: bytes | str):
+        try:
+            event = CacheEvent.load(data)
+        except (ValueError, TypeError):
+            log.warning("Received an invalid DexScript cache event")
             return
 
-        found_yield.value[self.args[3].name.lower()] = new_attribute.name
+        if event.origin != self.origin:
+            apply_event(event)
 
-        await self.ctx.send(f"Updated yielded {update_message}")
 
-    async def view(self):
-        returned_model = await self.parser.get_model(self.args[1], self.args[2].name)
+class PostgresBus(InvalidationBus):
+    """
+    Broadcasts events with Postgres LISTEN/NOTIFY on the bot's database.
+    """
 
-        if not in_list(self.args, 3):
-            fields = {"content": "```"}
+    def __init__(self):
+        super().__init__()
 
-            for key, value in vars(returned_model).items():
-                if key.startswith("_"):
-                    continue
+        self.connection = None
+        self.reconnect_task = None
+        self.stopping = False
+
+    async def start(self):
+        import asyncpg
+
+        client = connections.get("default")
 
-                fields["content"] += f"{key}: {value}\n"
+        self.connection = await asyncpg.connect(
+            host=client.host,
+            port=client.port,
+            user=client.user,
+            password=client.password,
+            database=client.database,
+        )
 
-                if isinstance(value, str) and value.startswith("/static"):
-                    if fields.get("files") is None:
-                        fields["files"] = []
-                    fields["files"].append(discord.File(value[1:]))
+        self.connection.add_termination_listener(self.terminated)
+        await self.connection.add_listener(BUS_CHANNEL, self.listener)
 
-            fields["content"] += "```"
+    def listener(self, _connection, _pid, _channel, payload: str):
+        self.receive(payload)
 
-            await self.ctx.send(**fields)
+    def terminated(self, _connection):
+        if self.stopping:
             return
 
-        attribute = getattr(returned_model, self.args[3].name.lower())
+        # Events sent while disconnected are lost, so nothing cached can be trusted.
+        log.warning("DexScript cache bus lost its LISTEN connection, reconnecting")
+        identifier_index.clear()
+
+        self.reconnect_task = asyncio.create_task(self.reconnect())
+
+    async def reconnect(self):
+        delay = 1
+
+        while not self.stopping:
+            try:
+                await self.start()
+            except Exception:
+                log.exception(f"Failed to reconnect the DexScript cache bus, retrying in {delay}s")
 
-        if isinstance(attribute, str) and os.path.isfile(attribute[1:]):
-            await self.ctx.send(f"```{attribute}```", file=discord.File(attribute[1:]))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, BUS_RECONNECT_DELAY)
+                continue
+
+            identifier_index.clear()
+            log.info("DexScript cache bus reconnected")
             return
 
-        await self.ctx.send(f"```{attribute}```")
+    async def stop(self):
+        self.stopping = True
 
-    async def list(self):
-        model = self.args[1].name
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
 
-        parameters = "GLOBAL YIELDS:\n\n"
+        if self.connection is not None:
+            await self.connection.close()
 
-        model_name = model if isinstance(model, str) else model.__name__
+    async def send(self, data: bytes):
+        await connections.get("default").execute_query(
+            "SELECT pg_notify($1, $2)", [BUS_CHANNEL, data.decode("UTF-8")]
+        )
 
-        if model_name.lower() != "-yields":
-            parameters = f"{model_name.upper()} FIELDS:\n\n"
 
-            for field in vars(model()):  # type: ignore
-                if field[:1] == "_":
-                    continue
+class UnixSocketBus(InvalidationBus, asyncio.DatagramProtocol):
+    """
+    Broadcasts events with Unix datagram sockets, for processes on the same host.
 
-                parameters += f"- {field.replace(' ', '_').upper()}\n"
-        else:
-            for index, dex_yield in enumerate(dex_yields, start=1):
-                parameters += f"{index}. {dex_yield.identifier.name.upper()}\n"
+    Every process binds a socket in `BUS_SOCKET_DIRECTORY` and sends events to the others.
+    """
 
-        await self.ctx.send(f"```\n{parameters}\n```")
+    def __init__(self):
+        super().__init__()
 
-    async def file(self):
-        match self.args[1].name.lower():
-            case "write":
-                new_file = self.ctx.message.attachments[0]
+        self.path = BUS_SOCKET_DIRECTORY / f"{os.getpid()}.sock"
+        self.transport = None
+        self.sender = None
 
-                with open(self.args[2].name, "w") as opened_file:
-                    contents = await new_file.read()
-                    opened_file.write(contents.decode("utf-8"))
+    async def start(self):
+        BUS_SOCKET_DIRECTORY.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
 
-                await self.ctx.send(f"Wrote to `{self.args[2]}`")
+        self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self, local_addr=str(self.path), family=socket.AF_UNIX
+        )
 
-            case "clear":
-                with open(self.args[2].name, "w") as _:
-                    pass
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
 
-                await self.ctx.send(f"Cleared `{self.args[2]}`")
+    def datagram_received(self, data, addr):
+        self.receive(data)
 
-            case "read":
-                await self.ctx.send(file=discord.File(self.args[2].name))
+    async def stop(self):
+        if self.transport is not None:
+            self.transport.close()
 
-            case "delete":
-                os.remove(self.args[1].name)
+        if self.sender is not None:
+            self.sender.close()
 
-                await self.ctx.send(f"Deleted `{self.args[1]}`")
+        self.path.unlink(missing_ok=True)
 
-            case _:
-                raise DexScriptError(
-                    f"'{self.args[0]}' is not a valid file operation. "
-                    "(READ, WRITE, CLEAR, or DELETE)"
-                )
+    async def send(self, data: bytes):
+        for path in BUS_SOCKET_DIRECTORY.glob("*.sock"):
+            if path == self.path:
+                continue
 
-    async def show(self):
-        await self.ctx.send(f"```\n{self.args[1]}\n```")
+            try:
+                self.sender.sendto(data, str(path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                path.unlink(missing_ok=True)
+            except BlockingIOError:
+                log.warning(f"DexScript cache bus socket {path} is full, dropping event")
 
 
-class DexScriptParser:
+BUSES = {
+    "local": InvalidationBus,
+    "postgres": PostgresBus,
+    "unix": UnixSocketBus,
+}
+
+invalidation_bus = InvalidationBus()
+
+
+@dataclass
+class SnapshotDiff:
+    key: str
+    model: Any
+    fields: list[str]
+    changed: list = datafield(default_factory=list)
+    deleted: list = datafield(default_factory=list)
+    created: list = datafield(default_factory=list)
+
+    def instances(self, rows):
+        fields_map = self.model._meta.fields_map
+
+        return [
+            self.model(**{x: Snapshot.decode(fields_map[x], y) for x, y in zip(self.fields, row)})
+            for row in rows
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.key.upper()}: {len(self.changed)} changed, "
+            f"{len(self.deleted)} deleted, {len(self.created)} created"
+        )
+
+
+class Snapshot:
     """
-    This class is used to parse DexScript into Python code.
+    Point-in-time snapshots of model tables, stored as gzip-compressed JSONL files.
+
+    A snapshot starts with a header line. Every model then has a line listing its fields,
+    followed by one JSON array per row, ordered by primary key.
     """
 
-    def __init__(self, ctx):
-        self.ctx = ctx
-        self.values = []
+    @staticmethod
+    def path(name: str) -> Path:
+        name = Path(name).name
+
+        if not name.endswith(SNAPSHOT_EXTENSION):
+            name += SNAPSHOT_EXTENSION
+
+        return SNAPSHOT_DIRECTORY / name
 
     @staticmethod
-    def is_number(string):
-        try:
-            float(string)
-            return True
-        except ValueError:
-            return False
+    def fields(model) -> list[str]:
+        pk = model._meta.pk_attr
+
+        return [pk] + sorted(x for x in model._meta.fields_db_projection if x != pk)
 
     @staticmethod
-    def is_date(string):
+    def encode(value):
+        if isinstance(value, Enum):
+            return value.value
+
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+
+        return str(value)
+
+    @staticmethod
+    def normalize(row) -> list:
+        return json.loads(json.dumps(list(row), default=Snapshot.encode))
+
+    @staticmethod
+    def decode(field, value):
+        if value is None:
+            return None
+
+        if getattr(field, "enum_type", None) is not None:
+            return field.enum_type(value)
+
+        expected = getattr(field, "field_type", None)
+
+        if expected is datetime:
+            return datetime.fromisoformat(value)
+
+        if expected is date:
+            return date.fromisoformat(value)
+
+        if expected in [Decimal, uuid.UUID]:
+            return expected(value)
+
+        return value
+
+    @staticmethod
+    async def batches(model, fields: list[str], connection=None):
+        """
+        Streams the rows of a model in batches, using keyset pagination on its primary key.
+        """
+
+        last_pk = None
+
+        while True:
+            queryset = model.all()
+
+            if last_pk is not None:
+                queryset = model.filter(**{f"{fields[0]}__gt": last_pk})
+
+            if connection is not None:
+                queryset = queryset.using_db(connection)
+
+            batch = (
+                await queryset.order_by(fields[0]).limit(SNAPSHOT_BATCH_SIZE).values_list(*fields)
+            )
+
+            if batch == []:
+                return
+
+            yield batch
+
+            last_pk = batch[-1][0]
+
+    @staticmethod
+    async def create(keys: list[str]) -> tuple[Path, dict]:
+        """
+        Streams the rows of every listed model into a new snapshot.
+
+        Parameters
+        ----------
+        keys: list[str]
+          The `MODELS` keys of the models you want to snapshot.
+        """
+
+        SNAPSHOT_DIRECTORY.mkdir(parents=True, exist_ok=True)
+
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        name = f"snapshot-{'-'.join(keys)}-{timestamp}"
+        path = Snapshot.path(name)
+        counts = {}
+
+        i = 1
+
+        while path.exists():
+            path = Snapshot.path(f"{name}-{i}")
+            i = i + 1
+
         try:
-            parse_date(string)
-            return True
-        except Exception:
-            return False
+            with gzip.open(path, "xt", encoding="UTF-8") as file:
+                file.write(json.dumps({"created": timestamp, "models": keys}) + "\n")
+
+                for key in keys:
+                    model = MODELS[key][0]
+                    fields = Snapshot.fields(model)
+
+                    file.write(json.dumps({"model": key, "fields": fields}) + "\n")
+                    counts[key] = 0
+
+                    async for batch in Snapshot.batches(model, fields):
+                        lines = [json.dumps(list(x), default=Snapshot.encode) for x in batch]
+
+                        await asyncio.to_thread(file.write, "\n".join(lines) + "\n")
+                        counts[key] += len(batch)
+        except FileExistsError:
+            raise
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+
+        return path, counts
+
+    @staticmethod
+    def header(path: Path) -> dict:
+        with gzip.open(path, "rt", encoding="UTF-8") as file:
+            return json.loads(file.readline())
+
+    @staticmethod
+    def load(path: Path) -> dict[str, tuple[list[str], dict]]:
+        tables = {}
+        current = None
+
+        with gzip.open(path, "rt", encoding="UTF-8") as file:
+            file.readline()
+
+            for line in file:
+                data = json.loads(line)
+
+                if isinstance(data, dict):
+                    current = data["model"]
+                    tables[current] = (data["fields"], {})
+                    continue
+
+                tables[current][1][data[0]] = data
+
+        return tables
+
+    @staticmethod
+    async def diff(path: Path, connection=None) -> list[SnapshotDiff]:
+        """
+        Compares a snapshot with the current rows of its models.
+
+        Parameters
+        ----------
+        path: Path
+          The path of the snapshot.
+        connection: BaseDBAsyncClient
+          The connection the current rows are read with, such as an open transaction.
+        """
+
+        if not path.is_file():
+            raise DexScriptError(f"Snapshot '{path.name}' does not exist.")
+
+        tables = await asyncio.to_thread(Snapshot.load, path)
+        diffs = []
+
+        for key, (fields, rows) in tables.items():
+            model = MODELS[key][0]
+
+            if Snapshot.fields(model) != fields:
+                raise DexScriptError(f"The fields of {key.upper()} changed since '{path.name}'.")
+
+            diff = SnapshotDiff(key, model, fields)
+
+            async for batch in Snapshot.batches(model, fields, connection):
+                for row in batch:
+                    row = Snapshot.normalize(row)
+                    stored = rows.pop(row[0], None)
+
+                    if stored is None:
+                        diff.created.append(row[0])
+                    elif stored != row:
+                        diff.changed.append(stored)
+
+            diff.deleted = list(rows.values())
+            diffs.append(diff)
+
+        return diffs
+
+    @staticmethod
+    async def check_cascades(diffs: list[SnapshotDiff], connection=None):
+        """
+        Rejects a restore that would delete rows whose children are cascade-deleted with them,
+        when the children's model isn't part of the snapshot and couldn't be restored.
+        """
+
+        models = [x.model for x in diffs]
+        keys = {y[0]: x for x, y in MODELS.items()}
+
+        for diff in diffs:
+            if diff.created == []:
+                continue
+
+            meta = diff.model._meta
+
+            for name in meta.backward_fk_fields | meta.backward_o2o_fields:
+                child = meta.fields_map[name].related_model
+
+                if child in models:
+                    continue
+
+                for child_field in child._meta.fk_fields | child._meta.o2o_fields:
+                    field = child._meta.fields_map[child_field]
+                    on_delete = str(getattr(field, "on_delete", "")).upper()
+
+                    if field.related_model != diff.model or not on_delete.endswith("CASCADE"):
+                        continue
+
+                    children = await (
+                        child.filter(**{f"{field.source_field}__in": diff.created})
+                        .using_db(connection)
+                        .count()
+                    )
+
+                    if children == 0:
+                        continue
+
+                    if child in keys:
+                        hint = f"Snapshot `{keys[child].upper()}` along with `{diff.key.upper()}`"
+                    else:
+                        hint = f"Delete those `{child.__name__}` rows first"
+
+                    raise DexScriptError(
+                        f"Restoring would delete `{len(diff.created)}` {diff.key.upper()} rows "
+                        f"and `{children}` `{child.__name__}` rows that depend on them, which "
+                        f"the snapshot can't bring back. {hint} to restore it."
+                    )
+
+    @staticmethod
+    async def restore(path: Path) -> list[SnapshotDiff]:
+        """
+        Restores the changed rows of a snapshot with bulk queries in a single transaction.
+
+        The diff is taken inside the transaction. Rows created since the snapshot are deleted
+        first, children first, so restored rows can't collide with them on unique columns.
+        Changed rows are then updated and deleted rows are inserted again, parents first,
+        so list parent models before their children.
+
+        Parameters
+        ----------
+        path: Path
+          The path of the snapshot.
+        """
+
+        async with in_transaction() as connection:
+            diffs = await Snapshot.diff(path, connection)
+
+            await Snapshot.check_cascades(diffs, connection)
+
+            for diff in reversed(diffs):
+                if diff.created != []:
+                    await diff.model.filter(pk__in=diff.created).using_db(connection).delete()
+
+            for diff in diffs:
+                if diff.changed == []:
+                    continue
+
+                # Changed rows pointing at deleted rows may have been cascade-deleted with them.
+                existing = await (
+                    diff.model.filter(pk__in=[x[0] for x in diff.changed])
+                    .using_db(connection)
+                    .values_list(diff.fields[0], flat=True)
+                )
+                existing = {Snapshot.normalize([x])[0] for x in existing}
+
+                diff.deleted += [x for x in diff.changed if x[0] not in existing]
+                diff.changed = [x for x in diff.changed if x[0] in existing]
+
+                if diff.changed != []:
+                    await diff.model.bulk_update(
+                        diff.instances(diff.changed),
+                        fields=diff.fields[1:],
+                        batch_size=SNAPSHOT_BATCH_SIZE,
+                        using_db=connection,
+                    )
+
+            for diff in diffs:
+                if diff.deleted != []:
+                    await diff.model.bulk_create(
+                        diff.instances(diff.deleted),
+                        batch_size=SNAPSHOT_BATCH_SIZE,
+                        using_db=connection,
+                    )
+
+        return diffs
+
+
+class Methods:
+    def __init__(self, parser, ctx, args: list[Value]):
+        self.ctx = ctx
+        self.args, self.flags = parser.parse_flags(args)
+
+        self.parser = parser
+
+    async def push(self):
+        global dex_yields
+
+        if "clear" in self.flags:
+            dex_yields = []
+
+            self.parser.send("Cleared yield cache.")
+            return
+
+        for index, yield_object in enumerate(dex_yields, start=1):
+            if in_list(self.args, 1) and int(self.args[1].name) >= index:
+                break
+
+            match yield_object.type:
+                case YieldType.CREATE_MODEL:
+                    instance = await yield_object.model.create(**yield_object.value)
+                    await self.parser.invalidate(yield_object.model, "create", instance.pk)
+
+        plural = "" if len(dex_yields) == 1 else "s"
+        number = self.args[1].name if in_list(self.args, 1) else len(dex_yields)
+
+        self.parser.send(f"Pushed `{number}` yield{plural}.")
+
+        dex_yields = []
+
+    async def create(self):
+        result = await self.parser.create_model(
+            self.args[1].name, self.args[2], self.args[3] if in_list(self.args, 3) else False
+        )
+
+        suffix = ""
+
+        if isinstance(result, Yield):
+            suffix = " and yielded it until `push`"
+            dex_yields.append(result)
+        else:
+            await self.parser.invalidate(self.args[1].name, "create", result.pk)
+
+        self.parser.send(f"Created `{self.args[2]}`{suffix}")
+
+    async def delete(self):
+        matched, missing = await self.parser.resolve_identifiers(self.args[1], self.args[2])
+
+        deleted = await self.parser.filter_identifiers(self.args[1], matched).delete()
+        await self.parser.invalidate(self.args[1].name, "delete")
+
+        stale = await self.parser.check_affected(self.args[1], matched, deleted)
+
+        self.parser.send(f"Deleted {format_identifiers(matched)}{stale}{format_missing(missing)}")
+
+    async def update(self):
+        index = await self.parser.identifiers(self.args[1])
+        known = set(index) | Yield.names(self.args[1].name)
+
+        identifiers = self.parser.split_identifiers(self.args[2], known)
+        found_yields = [Yield.get(self.args[1].name, x) for x in identifiers]
+
+        new_attribute = None
+
+        if self.ctx.message.attachments != []:
+            image_path = await save_file(self.ctx.message.attachments[0])
+            new_attribute = Value(f"/{image_path}", Types.STRING)
+        else:
+            new_attribute = self.args[4]
+
+        attribute = self.args[3].text.lower()
+        update_message = f"{self.args[3].text} to `{new_attribute.name}`"
+
+        for found_yield in found_yields:
+            if found_yield is None:
+                continue
+
+            found_yield.value[attribute] = new_attribute.name
+
+            self.parser.send(f"Updated yielded `{found_yield.identifier}'s` {update_message}")
+
+        remaining = [x for x, y in zip(identifiers, found_yields) if y is None]
+
+        if remaining == []:
+            return
+
+        matched, missing = await self.parser.resolve_identifiers(self.args[1], remaining)
+
+        updated = await self.parser.filter_identifiers(self.args[1], matched).update(
+            **{attribute: new_attribute.name}
+        )
+        await self.parser.invalidate(self.args[1].name, "update")
+
+        stale = await self.parser.check_affected(self.args[1], matched, updated)
+
+        self.parser.send(
+            f"Updated {format_identifiers(matched)} {update_message}"
+            f"{stale}{format_missing(missing)}"
+        )
+
+    async def view(self):
+        depth = self.parser.flag_number(self.flags, "depth", 1)
+        attribute = self.args[3].text.lower() if in_list(self.args, 3) else None
+
+        matched, missing = await self.parser.resolve_identifiers(self.args[1], self.args[2])
+
+        queryset = self.parser.filter_identifiers(self.args[1], matched)
+
+        if depth > 0:
+            queryset = queryset.select_related(
+                *self.parser.relation_paths(self.args[1].name, depth)
+            )
+
+        returned_models = await queryset
+
+        if missing != []:
+            self.parser.send(f"Found {format_identifiers(matched)}{format_missing(missing)}")
+
+        for returned_model in returned_models:
+            if attribute is None:
+                content, files = self.parser.render_model(returned_model, depth)
+
+                fields: dict[str, Any] = {"content": f"```\n{content}```"}
+
+                if files != []:
+                    fields["files"] = files
+
+                self.parser.send(**fields)
+                continue
+
+            value = getattr(returned_model, attribute)
+
+            if depth > 0 and attribute in self.parser.relations(type(returned_model)):
+                content, _ = self.parser.render_model(value, depth - 1)
+                self.parser.send(f"```\n{content}```")
+                continue
+
+            if isinstance(value, str) and os.path.isfile(value[1:]):
+                self.parser.send(f"```{value}```", file=discord.File(value[1:]))
+                continue
+
+            self.parser.send(f"```{value}```")
+
+    async def list(self):
+        parameters = "GLOBAL YIELDS:\n\n"
+
+        if in_list(self.args, 2) and str(self.args[2]).lower() == "rows":
+            paginator = self.parser.row_paginator(self.ctx.author, self.args, self.flags)
+
+            content = await paginator.load_next()
+
+            self.parser.send(content, view=paginator)
+            return
+
+        if "yields" not in self.flags:
+            model = self.args[1].name
+            parameters = f"{model.__name__.upper()} FIELDS:\n\n"
+
+            for field in vars(model()):  # type: ignore
+                if field[:1] == "_":
+                    continue
+
+                parameters += f"- {field.replace(' ', '_').upper()}\n"
+        else:
+            for index, dex_yield in enumerate(dex_yields, start=1):
+                parameters += f"{index}. {dex_yield.identifier.name.upper()}\n"
+
+        self.parser.send(f"```\n{parameters}\n```")
+
+    async def file(self):
+        match self.args[1].name.lower():
+            case "write":
+                new_file = self.ctx.message.attachments[0]
+
+                with open(self.args[2].name, "w") as opened_file:
+                    contents = await new_file.read()
+                    opened_file.write(contents.decode("utf-8"))
+
+                self.parser.send(f"Wrote to `{self.args[2]}`")
+
+            case "clear":
+                with open(self.args[2].name, "w") as _:
+                    pass
+
+                self.parser.send(f"Cleared `{self.args[2]}`")
+
+            case "read":
+                self.parser.send(file=discord.File(self.args[2].name))
+
+            case "delete":
+                os.remove(self.args[1].name)
+
+                self.parser.send(f"Deleted `{self.args[1]}`")
+
+            case _:
+                raise DexScriptError(
+                    f"'{self.args[0]}' is not a valid file operation. "
+                    "(READ, WRITE, CLEAR, or DELETE)"
+                )
+
+    async def show(self):
+        self.parser.send(f"```\n{self.args[1]}\n```")
+
+    async def count(self):
+        rows = await self.parser.aggregate_query("count", self.args, self.flags)
+        self.parser.send(self.parser.format_aggregate("count", self.args, self.flags, rows))
+
+    async def sum(self):
+        rows = await self.parser.aggregate_query("sum", self.args, self.flags)
+        self.parser.send(self.parser.format_aggregate("sum", self.args, self.flags, rows))
+
+    async def avg(self):
+        rows = await self.parser.aggregate_query("avg", self.args, self.flags)
+        self.parser.send(self.parser.format_aggregate("avg", self.args, self.flags, rows))
+
+    async def min(self):
+        rows = await self.parser.aggregate_query("min", self.args, self.flags)
+        self.parser.send(self.parser.format_aggregate("min", self.args, self.flags, rows))
+
+    async def max(self):
+        rows = await self.parser.aggregate_query("max", self.args, self.flags)
+        self.parser.send(self.parser.format_aggregate("max", self.args, self.flags, rows))
+
+    async def snapshot(self):
+        keys = [self.parser.model_key(x) for x in self.args[1:]]
+
+        path, counts = await Snapshot.create(keys)
+
+        summary = ", ".join(f"`{x}` {key.upper()}" for key, x in counts.items())
+        self.parser.send(f"Saved snapshot `{path.name}` with {summary} rows")
+
+    async def diff(self):
+        diffs = await Snapshot.diff(Snapshot.path(str(self.args[1])))
+
+        self.parser.send(self.parser.format_diffs(diffs))
+
+    async def restore(self):
+        diffs = await Snapshot.restore(Snapshot.path(str(self.args[1])))
+
+        for diff in diffs:
+            await self.parser.invalidate(diff.model, "restore")
+
+        self.parser.send(f"Restored `{self.args[1]}`\n{self.parser.format_diffs(diffs)}")
+
+
+class RowPaginator(discord.ui.View):
+    """
+    Pages through the rows of a model with keyset pagination, so only the current page
+    is ever held in memory.
+    """
+
+    def __init__(self, author, model, fields: list[str], filters: dict, limit: int):
+        super().__init__(timeout=300)
+
+        self.author = author
+        self.model = model
+        self.pk = model._meta.pk_attr
+        self.fields = [self.pk] + [x for x in fields if x != self.pk]
+        self.filters = filters
+        self.limit = limit
+
+        self.page = 0
+        self.first_pk = None
+        self.last_pk = None
+
+    def queryset(self, forward: bool):
+        """
+        Returns the query for the page after the last row shown, or before the first row shown.
+        """
+
+        queryset = self.model.filter(**self.filters)
+
+        if forward:
+            if self.last_pk is not None:
+                queryset = queryset.filter(**{f"{self.pk}__gt": self.last_pk})
+
+            queryset = queryset.order_by(self.pk)
+        else:
+            queryset = queryset.filter(**{f"{self.pk}__lt": self.first_pk})
+            queryset = queryset.order_by(f"-{self.pk}")
+
+        return queryset.limit(self.limit + 1)
+
+    async def fetch(self, forward: bool):
+        rows = await self.queryset(forward).values(*self.fields)
+
+        has_more = len(rows) > self.limit
+        rows = rows[: self.limit]
+
+        if not forward:
+            rows.reverse()
+
+        return rows, has_more
+
+    def render(self, rows):
+        header = " | ".join(x.upper() for x in self.fields)
+        lines = [" | ".join(str(row[x]) for x in self.fields) for row in rows]
+
+        content = f"```\n{self.model.__name__.upper()} ROWS (PAGE {self.page})\n\n{header}\n"
+        content += "\n".join(lines) if lines else "No rows found."
+
+        if len(content) > MESSAGE_LIMIT - 4:
+            content = content[: MESSAGE_LIMIT - 8] + "\n..."
+
+        return content + "\n```"
+
+    def show(self, rows, has_previous: bool, has_next: bool):
+        if rows != []:
+            self.first_pk = rows[0][self.pk]
+            self.last_pk = rows[-1][self.pk]
+
+        self.previous_button.disabled = not has_previous
+        self.next_button.disabled = not has_next
+
+        return self.render(rows)
+
+    async def load_next(self):
+        rows, has_more = await self.fetch(True)
+        self.page += 1
+
+        return self.show(rows, self.page > 1, has_more)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author.id
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_button(self, interaction: discord.Interaction, _: discord.ui.Button):
+        rows, has_more = await self.fetch(False)
+        self.page -= 1
+
+        content = self.show(rows, has_more, True)
+        await interaction.response.edit_message(content=content, view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, _: discord.ui.Button):
+        content = await self.load_next()
+        await interaction.response.edit_message(content=content, view=self)
+
+
+@dataclass
+class PlanStep:
+    description: str
+    sql: str | None = None
+    estimate: Any = None
+
+
+class ScriptPlanner:
+    """
+    Describes the queries each statement would issue, without executing any of them.
+
+    Every `Methods` verb that issues queries is mapped to a `plan_<verb>` method in `plans`.
+    """
+
+    def __init__(self, parser, args: list[Value], flags: dict):
+        self.parser = parser
+        self.args = args
+        self.flags = flags
+
+        self.plans = {
+            "push": self.plan_push,
+            "create": self.plan_create,
+            "delete": self.plan_delete,
+            "update": self.plan_update,
+            "view": self.plan_view,
+            "list": self.plan_list,
+            **{x: partial(self.plan_aggregate, x) for x in AGGREGATES},
+            "snapshot": self.plan_snapshot,
+            "diff": self.plan_diff,
+            "restore": self.plan_restore,
+        }
+
+    def lookup(self, model) -> list[PlanStep]:
+        index = identifier_index.get(model.name.__name__)
+
+        if index is not None:
+            return [PlanStep(f"Identifier lookup: cached ({len(index)} identifiers)")]
+
+        field = self.parser.translate(model.extra_data[0].lower())
+
+        return [
+            PlanStep(
+                "Identifier lookup: FULL SCAN of the identifier column",
+                model.name.all().values_list(field, flat=True).sql(),
+                model.name.all(),
+            )
+        ]
+
+    def identifier_filter(self, model, identifiers):
+        index = identifier_index.get(model.name.__name__, {})
+        values = [index.get(x, x) for x in self.parser.split_identifiers(identifiers, index)]
+
+        return self.parser.filter_identifiers(model, values)
+
+    async def plan_push(self):
+        if "clear" in self.flags:
+            return [PlanStep("Clears the yield cache")]
+
+        return [
+            PlanStep(f"INSERT INTO {x.model._meta.db_table} ({x.identifier})") for x in dex_yields
+        ]
+
+    async def plan_create(self):
+        model = self.args[1].name
+
+        if in_list(self.args, 3) and self.args[3].name:
+            return [PlanStep(f"Yields a new {model.__name__} until `push`")]
+
+        steps = []
+
+        if "regime_id" in vars(model()):
+            steps.append(PlanStep("Fetches the first regime", Regime.all().limit(1).sql()))
+
+        steps.append(PlanStep(f"INSERT INTO {model._meta.db_table} ({self.args[2]})"))
+
+        return steps
+
+    async def plan_delete(self):
+        queryset = self.identifier_filter(self.args[1], self.args[2])
+
+        return self.lookup(self.args[1]) + [PlanStep("DELETE", queryset.delete().sql(), queryset)]
+
+    async def plan_update(self):
+        index = identifier_index.get(self.args[1].name.__name__, {})
+        known = set(index) | Yield.names(self.args[1].name)
+
+        identifiers = self.parser.split_identifiers(self.args[2], known)
+        remaining = [x for x in identifiers if Yield.get(self.args[1].name, x) is None]
+
+        steps = [
+            PlanStep(f"Updates yielded `{x}`, no query") for x in identifiers if x not in remaining
+        ]
+
+        if remaining == []:
+            return steps
+
+        queryset = self.identifier_filter(self.args[1], remaining)
+        value = self.args[4].name if in_list(self.args, 4) else None
+        update = queryset.update(**{self.args[3].text.lower(): value})
+
+        return steps + self.lookup(self.args[1]) + [PlanStep("UPDATE", update.sql(), queryset)]
+
+    async def plan_view(self):
+        depth = self.parser.flag_number(self.flags, "depth", 1)
+        queryset = self.identifier_filter(self.args[1], self.args[2])
+
+        if depth > 0:
+            queryset = queryset.select_related(
+                *self.parser.relation_paths(self.args[1].name, depth)
+            )
+
+        return self.lookup(self.args[1]) + [PlanStep("SELECT", queryset.sql(), queryset)]
+
+    async def plan_list(self):
+        if "yields" in self.flags or not in_list(self.args, 2):
+            return []
+
+        paginator = self.parser.row_paginator(None, self.args, self.flags)
+        queryset = paginator.queryset(True)
+
+        return [
+            PlanStep(
+                "Keyset SELECT of the first page (WHERE pk > last ORDER BY pk LIMIT n + 1)",
+                queryset.values(*paginator.fields).sql(),
+                queryset,
+            )
+        ]
+
+    async def plan_aggregate(self, function):
+        queryset, fields = self.parser.aggregate_queryset(function, self.args, self.flags)
+
+        # `ValuesQuery` has no `explain`, so the estimate runs on the annotated queryset.
+        return [
+            PlanStep(
+                f"Aggregates with {function.upper()}",
+                queryset.values(*fields).sql(),
+                queryset,
+            )
+        ]
+
+    async def plan_snapshot(self):
+        steps = []
+
+        for arg in self.args[1:]:
+            fields = Snapshot.fields(arg.name)
+            queryset = arg.name.all().order_by(fields[0]).limit(SNAPSHOT_BATCH_SIZE)
+
+            steps.append(
+                PlanStep(
+                    f"Streams {arg.name.__name__} in batches of {SNAPSHOT_BATCH_SIZE} rows",
+                    queryset.values_list(*fields).sql(),
+                    arg.name.all(),
+                )
+            )
+
+        return steps
+
+    async def plan_diff(self):
+        path = Snapshot.path(str(self.args[1]))
+
+        if not path.is_file():
+            return [PlanStep(f"Snapshot '{path.name}' does not exist.")]
+
+        return [
+            PlanStep(
+                f"Streams {MODELS[key][0].__name__} in batches of {SNAPSHOT_BATCH_SIZE} rows "
+                "and compares them with the snapshot",
+                estimate=MODELS[key][0].all(),
+            )
+            for key in Snapshot.header(path)["models"]
+        ]
+
+    async def plan_restore(self):
+        steps = await self.plan_diff()
+
+        steps.append(PlanStep("Bulk DELETE, UPDATE and INSERT of changed rows in a transaction"))
+
+        return steps
+
+
+class ScriptValidator:
+    """
+    Checks compiled DexScript code for errors before any statement is executed.
+
+    Every `Methods` verb with checks is mapped to a `check_<verb>` method in `checks`.
+    Identifiers are collected while checking and validated in one batch per model at the end,
+    and a statement is only rejected when none of its identifiers exist.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.errors: list[str] = []
+        self.statement = 0
+
+        self.lookups: dict[Any, list[tuple[int, Value, list[str]]]] = {}
+        self.created: dict[Any, set[str]] = {}
+
+        self.checks = {
+            "create": self.check_create,
+            "delete": self.check_delete,
+            "update": self.check_update,
+            "view": self.check_view,
+            "list": self.check_list,
+            **{x: self.check_aggregate for x in AGGREGATES},
+            "snapshot": self.check_snapshot,
+            "diff": self.check_diff,
+            "restore": self.check_diff,
+        }
+
+    def error(self, message: str, statement: int | None = None):
+        self.errors.append(f"Statement {statement or self.statement}: {message}")
+
+    def model(self, args: list[Value]):
+        if args[1].type != Types.MODEL:
+            self.error(f"'{args[1]}' is not a valid model.")
+            return None
+
+        return args[1].name
+
+    def field(self, model, name: str):
+        fields = model._meta.fields_map
+        name = self.parser.translate(name.lower())
+
+        if name in fields:
+            return fields[name]
+
+        try:
+            self.parser.autocorrect(name, list(fields), f"is not a field of {model.__name__}.")
+        except DexScriptError as error:
+            self.error(str(error).replace("\n", " "))
+
+        return None
+
+    def check_type(self, field, value, label: str):
+        """
+        Checks that a value can be stored in a field.
+        """
+
+        expected = getattr(field, "field_type", None)
+
+        if value is None or expected is None:
+            return
+
+        is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+
+        if expected is bool:
+            valid = isinstance(value, bool)
+        elif expected is int:
+            valid = is_number and float(value).is_integer()
+        elif expected in [float, Decimal]:
+            valid = is_number
+        elif expected in [datetime, date]:
+            valid = isinstance(value, datetime)
+        else:
+            return
+
+        if not valid:
+            self.error(f"{label} expects {expected.__name__}, not '{value}'.")
+
+    def fields_flag(self, model, flags: dict):
+        for name in self.parser.split_identifiers(flags.get("fields", "")):
+            self.field(model, name)
+
+    def where_flag(self, model, flags: dict):
+        try:
+            filters = self.parser.parse_filters(flags.get("where", ""))
+        except DexScriptError as error:
+            self.error(str(error))
+            return
+
+        for key, value in filters.items():
+            name, _, lookup = key.partition("__")
+            field = self.field(model, name)
+
+            if field is not None and lookup in ["", *COMPARISON_LOOKUPS]:
+                self.check_type(field, value, f"'{key}'")
+
+    def number_flag(self, flags: dict, name: str):
+        try:
+            self.parser.flag_number(flags, name, 0)
+        except DexScriptError as error:
+            self.error(str(error))
+
+    def lookup(self, model_value: Value, identifiers):
+        self.lookups.setdefault(model_value.name, []).append(
+            (self.statement, model_value, identifiers)
+        )
+
+    def check_create(self, args, flags):
+        model = self.model(args)
+
+        if model is not None:
+            self.created.setdefault(model, set()).add(str(args[2]))
+
+    def check_delete(self, args, flags):
+        if self.model(args) is not None:
+            self.lookup(args[1], args[2])
+
+    def check_update(self, args, flags):
+        model = self.model(args)
+
+        if model is None:
+            return
+
+        field = self.field(model, args[3].text)
+
+        if self.parser.ctx.message.attachments == []:
+            if not in_list(args, 4):
+                self.error(f"Argument is missing when calling {args[0].name}.")
+            elif field is not None:
+                self.check_type(field, self.parser.convert(str(args[4])), f"'{args[3].text}'")
+
+        self.lookup(args[1], args[2])
+
+    def check_view(self, args, flags):
+        model = self.model(args)
+
+        if model is None:
+            return
+
+        if in_list(args, 3):
+            self.field(model, args[3].text)
+
+        self.number_flag(flags, "depth")
+        self.lookup(args[1], args[2])
+
+    def check_list(self, args, flags):
+        if "yields" in flags:
+            return
+
+        if not in_list(args, 1):
+            self.error(f"Argument is missing when calling {args[0].name}.")
+            return
+
+        model = self.model(args)
+
+        if model is None or not in_list(args, 2):
+            return
+
+        if str(args[2]).lower() != "rows":
+            self.error(f"'{args[2]}' is not a valid list type. (ROWS)")
+            return
+
+        self.fields_flag(model, flags)
+        self.where_flag(model, flags)
+        self.number_flag(flags, "limit")
+
+    def check_aggregate(self, args, flags):
+        model = self.model(args)
+
+        if model is None:
+            return
+
+        if in_list(args, 2):
+            self.field(model, args[2].text)
+
+        if "group" in flags:
+            self.field(model, flags["group"])
+
+        self.where_flag(model, flags)
+
+    def check_snapshot(self, args, flags):
+        for index in range(1, len(args)):
+            if args[index].type != Types.MODEL:
+                self.error(f"'{args[index]}' is not a valid model.")
+
+    def check_diff(self, args, flags):
+        path = Snapshot.path(str(args[1]))
+
+        if not path.is_file():
+            self.error(f"Snapshot '{path.name}' does not exist.")
+
+    async def check_identifiers(self):
+        for model, lookups in self.lookups.items():
+            created = self.created.get(model, set()) | Yield.names(model)
+            model_value = lookups[0][1]
+
+            index = await self.parser.identifiers(model_value)
+            known = created | set(index)
+
+            names = [x for _, _, y in lookups for x in self.parser.split_identifiers(y, known)]
+
+            if any(x not in known for x in names):
+                index = await self.parser.identifiers(model_value, refresh=True)
+                known = created | set(index)
+
+            for statement, _, identifiers in lookups:
+                names = self.parser.split_identifiers(identifiers, known)
+
+                # Partial misses are skipped and summarized when the statement runs.
+                if any(x in known for x in names):
+                    continue
+
+                for name in names:
+                    try:
+                        self.parser.autocorrect(name, list(index))
+                    except DexScriptError as error:
+                        self.error(str(error).replace("\n", " "), statement)
+
+    async def validate(self, parsed_code: list[list[Value]]) -> list[str]:
+        """
+        Validates every statement and returns all errors found.
+
+        Parameters
+        ----------
+        parsed_code: list[list[Value]]
+          The compiled code you want to validate.
+        """
+
+        for self.statement, line in enumerate(parsed_code, start=1):
+            args, flags = self.parser.parse_flags(line)
+
+            if args == [] or args[0].type != Types.METHOD:
+                self.error(f"'{self.parser.format_statement(line)}' does not start with a verb.")
+                continue
+
+            verb = args[0].name.lower()
+            minimum, maximum = ARITY.get(verb, (1, len(args)))
+
+            if len(args) < minimum:
+                self.error(f"Argument is missing when calling {args[0].name}.")
+                continue
+
+            if len(args) > maximum:
+                self.error(f"{args[0].name} takes at most {maximum - 1} arguments.")
+                continue
+
+            check = self.checks.get(verb)
+
+            if check is not None:
+                check(args, flags)
+
+        await self.check_identifiers()
+
+        return self.errors
+
+
+class DexScriptParser:
+    """
+    This class is used to parse DexScript into Python code.
+    """
+
+    def __init__(self, ctx, output: OutputQueue):
+        self.ctx = ctx
+        self.output = output
+        self.values = []
+
+    def send(self, content=None, **kwargs) -> asyncio.Future:
+        """
+        Queues a message in the context's channel without waiting for it to be sent.
+        """
+
+        return self.output.send(self.ctx, content, **kwargs)
+
+    @staticmethod
+    def is_number(string):
+        try:
+            float(string)
+            return True
+        except ValueError:
+            return False
+
+    @staticmethod
+    def is_date(string):
+        from dateutil.parser import parse as parse_date
+
+        try:
+            parse_date(string)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def autocorrect(string, correction_list, error="does not exist."):
+        autocorrection = get_close_matches(string, correction_list)
+
+        if not autocorrection or autocorrection[0] != string:
+            suggestion = f"\nDid you mean '{autocorrection[0]}'?" if autocorrection else ""
+
+            raise DexScriptError(f"'{string}' {error}{suggestion}")
+
+        return autocorrection[0]
+
+    async def create_model(self, model, identifier, yield_creation):
+        fields = {}
+
+        for key, field in vars(model()).items():
+            if field is not None:
+                continue
+
+            if key in ["id", "short_name"]:
+                continue
+
+            fields[key] = 1
+
+            if key in ["country", "full_name", "catch_names", "name"]:
+                fields[key] = identifier
+            elif key == "emoji_id":
+                fields[key] = 100**8
+            elif key == "regime_id":
+                first_regime = await Regime.first()
+                fields[key] = first_regime.pk
+
+        if yield_creation:
+            return Yield(model, identifier, fields, YieldType.CREATE_MODEL)
+
+        return await model.create(**fields)
+
+    @staticmethod
+    def split_identifiers(identifiers, known=()):
+        """
+        Splits a comma-separated identifier list, such as `a, b, c`, into a list of names,
+        dropping repeated names.
+
+        A value that is a known identifier as a whole, such as `Korea, South`, isn't split,
+        and names can be quoted to keep their commas, such as `"Korea, South", France`.
+
+        Parameters
+        ----------
+        identifiers: Value | list[str]
+          The identifier value you want to split.
+        known: Container[str]
+          The identifiers a whole value is checked against before it's split.
+        """
+
+        if isinstance(identifiers, list):
+            return list(dict.fromkeys(identifiers))
+
+        string = str(identifiers).strip()
+
+        if string in known:
+            return [string]
+
+        names = next(csv.reader([string], skipinitialspace=True), [])
+
+        return list(dict.fromkeys(x.strip() for x in names if x.strip() != ""))
+
+    async def invalidate(self, model, op: str, pk=None):
+        """
+        Removes a model's cached identifiers, forcing the next lookup to refetch them,
+        and broadcasts the write to other processes through the invalidation bus.
+
+        Parameters
+        ----------
+        model: Model
+          The model that was written to.
+        op: str
+          The write operation, such as `create`, `update`, or `delete`.
+        pk: Any
+          The primary key of the row that was written to, or `None` for bulk writes.
+        """
+
+        event = CacheEvent(model.__name__, pk, op)
+
+        apply_event(event)
+        await invalidation_bus.publish(event)
+
+    async def identifiers(self, model, refresh=False):
+        """
+        Returns a model's identifier index, which maps each identifier to its raw value.
+
+        Only the identifier column is fetched, and the result is cached until the model
+        is written to by DexScript.
+
+        Parameters
+        ----------
+        model: Value
+          The model you want to fetch the identifiers of.
+        refresh: bool
+          Whether the cached identifiers should be refetched.
+        """
+
+        if model.type != Types.MODEL:
+            raise DexScriptError(f"{model} is not a valid model.")
+
+        key = model.name.__name__
+
+        if refresh or key not in identifier_index:
+            field = self.translate(model.extra_data[0].lower())
+            values = await model.name.all().values_list(field, flat=True)
+
+            identifier_index[key] = {str(x): x for x in values}
+
+        return identifier_index[key]
+
+    async def resolve_identifiers(self, model, identifiers):
+        """
+        Validates a list of identifiers against a model's identifier index in one pass.
+
+        Returns the raw values of every identifier that matched, along with an error message
+        for every identifier that didn't. Raises a `DexScriptError` if nothing matched.
+
+        Parameters
+        ----------
+        model: Value
+          The model the identifiers belong to.
+        identifiers: Value | list[str]
+          The identifiers you want to resolve.
+        """
+
+        index = await self.identifiers(model)
+        names = self.split_identifiers(identifiers, index)
+
+        if any(x not in index for x in names):
+            index = await self.identifiers(model, refresh=True)
+            names = self.split_identifiers(identifiers, index)
+
+        matched = [index[x] for x in names if x in index]
+        missing = []
+
+        for identifier in names:
+            if identifier in index:
+                continue
+
+            try:
+                self.autocorrect(identifier, list(index))
+            except DexScriptError as error:
+                missing.append(str(error).replace("\n", " "))
+
+        if matched == []:
+            raise DexScriptError("\n".join(missing))
+
+        return matched, missing
+
+    def filter_identifiers(self, model, values):
+        """
+        Returns a queryset containing every instance of a model whose identifier is in `values`.
+        """
+
+        field = self.translate(model.extra_data[0].lower())
+
+        return model.name.filter(**{f"{field}__in": values})
+
+    async def check_affected(self, model, matched, affected: int):
+        """
+        Compares the number of rows a write affected with the identifiers it matched.
+
+        A lower count means the identifier index was stale, as rows were deleted or renamed
+        outside of DexScript. The index is refreshed, and a `DexScriptError` is raised if
+        no rows were affected at all. Otherwise, returns a note for the statement's summary.
+
+        Parameters
+        ----------
+        model: Value
+          The model that was written to.
+        matched: list
+          The identifier values the write filtered on.
+        affected: int
+          The number of rows the write affected.
+        """
+
+        if affected >= len(matched):
+            return ""
+
+        await self.identifiers(model, refresh=True)
+
+        if affected == 0:
+            raise DexScriptError(
+                f"{format_identifiers(matched)} no longer exist, no rows were changed. "
+                "The identifier index has been refreshed."
+            )
+
+        return (
+            f"\nOnly `{affected}` of `{len(matched)}` rows were changed, the rest no longer "
+            "exist. The identifier index has been refreshed."
+        )
+
+    @staticmethod
+    def parse_flags(args):
+        """
+        Separates flags, such as `-DEPTH 2`, from the positional arguments of a statement.
+
+        Only flags the statement's verb accepts in `FLAGS` are separated, so values such as
+        `-Deals damage` are passed through as arguments.
+
+        Parameters
+        ----------
+        args: list[Value]
+          The values of the statement.
+        """
+
+        positional = []
+        flags = {}
+
+        verb = args[0].name.lower() if args and args[0].type == Types.METHOD else None
+        accepted = FLAGS.get(verb, [])
+
+        for arg in args:
+            match = FLAG_RE.match(arg.name) if arg.type == Types.STRING else None
+
+            if match is None or match.group(1).lower() not in accepted:
+                positional.append(arg)
+                continue
+
+            flags[match.group(1).lower()] = (match.group(2) or "").strip()
+
+        return positional, flags
+
+    @staticmethod
+    def model_key(value: Value) -> str:
+        """
+        Returns the `MODELS` key of a model value.
+        """
+
+        if value.type != Types.MODEL:
+            raise DexScriptError(f"{value} is not a valid model.")
+
+        return next(key for key, model in MODELS.items() if model[0] == value.name)
+
+    @staticmethod
+    def format_diffs(diffs: list[SnapshotDiff]):
+        content = ""
+
+        for diff in diffs:
+            content += f"{diff}\n"
+
+            for label, pks in [
+                ("Changed", [x[0] for x in diff.changed]),
+                ("Deleted", [x[0] for x in diff.deleted]),
+                ("Created", diff.created),
+            ]:
+                if pks == []:
+                    continue
+
+                suffix = ", ..." if len(pks) > 10 else ""
+                content += f"  {label}: {', '.join(str(x) for x in pks[:10])}{suffix}\n"
+
+        return f"```\n{content[: MESSAGE_LIMIT - 8]}```"
+
+    def group_field(self, model, field: str):
+        """
+        Returns the field used to group rows by `field`. Relations are grouped by the
+        identifier of the related model, so groups show names instead of IDs.
+        """
+
+        related_model = self.relations(model).get(field)
+
+        if related_model is None:
+            return field
+
+        for model_value, identifier in MODELS.values():
+            if model_value == related_model:
+                return f"{field}__{self.translate(identifier.lower())}"
+
+        return f"{field}_id"
+
+    def aggregate_query(self, function: str, args: list[Value], flags: dict):
+        """
+        Builds the values query that aggregates a model's rows, see `aggregate_queryset`.
+        """
+
+        queryset, fields = self.aggregate_queryset(function, args, flags)
+
+        return queryset.values(*fields)
+
+    def aggregate_queryset(self, function: str, args: list[Value], flags: dict):
+        """
+        Builds the annotated queryset that aggregates a model's rows on the database, such as
+        `AVG > SPECIAL > RARITY > -GROUP regime > -WHERE enabled=true`, with the fields it
+        selects.
+
+        Parameters
+        ----------
+        function: str
+          The aggregate function, such as `count` or `avg`.
+        args: list[Value]
+          The positional arguments of the statement.
+        flags: dict
+          The flags of the statement.
+        """
+
+        model = args[1].name
+
+        if args[1].type != Types.MODEL:
+            raise DexScriptError(f"{args[1]} is not a valid model.")
+
+        if function == "count" and not in_list(args, 2):
+            field = model._meta.pk_attr
+        else:
+            field = self.translate(args[2].text.lower())
+
+        queryset = model.filter(**self.parse_filters(flags.get("where", ""))).annotate(
+            result=AGGREGATES[function](field)
+        )
+
+        if "group" not in flags:
+            return queryset, ["result"]
+
+        group = self.group_field(model, self.translate(flags["group"].lower()))
+
+        return queryset.group_by(group).order_by("-result"), [group, "result"]
+
+    def format_aggregate(self, function: str, args: list[Value], flags: dict, rows: list[dict]):
+        title = f"{function.upper()} OF {args[1].name.__name__.upper()}"
+
+        if in_list(args, 2):
+            title += f" {args[2].text.upper()}"
+
+        if "group" not in flags:
+            result = rows[0]["result"] if rows else None
+            return f"```\n{title}: {result}\n```"
+
+        group = self.group_field(args[1].name, self.translate(flags["group"].lower()))
+        content = f"{title} BY {flags['group'].upper()}\n\n"
+
+        for row in rows:
+            content += f"{row[group]}: {row['result']}\n"
+
+        if len(content) > MESSAGE_LIMIT - 8:
+            content = content[: MESSAGE_LIMIT - 12] + "\n..."
+
+        return f"```\n{content}```"
+
+    def row_paginator(self, author, args: list[Value], flags: dict):
+        """
+        Builds the paginator for `LIST > MODEL > ROWS`. Without `-FIELDS`, rows show
+        the model's identifier.
+        """
+
+        fields = self.split_identifiers(flags.get("fields", "")) or [args[1].extra_data[0]]
+        limit = self.flag_number(flags, "limit", ROW_PAGE_SIZE, ROW_PAGE_SIZE)
+
+        return RowPaginator(
+            author,
+            args[1].name,
+            [self.translate(x.lower()) for x in fields],
+            self.parse_filters(flags.get("where", "")),
+            max(min(limit, ROW_PAGE_LIMIT), 1),
+        )
+
+    def convert(self, string: str):
+        """
+        Converts a raw string into the Python value it represents, such as a number or boolean.
+        """
+
+        value = self.create_value(string.strip())
+
+        if value.type == Types.NUMBER:
+            number = float(value.name)
+            return int(number) if number.is_integer() else number
+
+        if value.type == Types.MODEL:
+            return string.strip()
+
+        return value.name
+
+    def parse_filters(self, string: str) -> dict:
+        """
+        Parses filters, such as `enabled=true, rarity__gt=1`, into queryset filters.
+
+        Parameters
+        ----------
+        string: str
+          The filters you want to parse.
+        """
+
+        filters = {}
+
+        for item in self.split_identifiers(string):
+            key, separator, value = item.partition("=")
+
+            if separator == "":
+                raise DexScriptError(f"'{item}' is not a valid filter. (FIELD=VALUE)")
+
+            filters[self.translate(key.strip().lower())] = self.convert(value)
+
+        return filters
+
+    @staticmethod
+    def flag_number(flags, name, default, fallback=0):
+        """
+        Returns a flag's numeric value, `default` if the flag has no value, and `fallback`
+        if the flag wasn't passed at all.
+        """
+
+        if name not in flags:
+            return fallback
+
+        if flags[name] == "":
+            return default
+
+        if not flags[name].isdigit():
+            raise DexScriptError(f"'-{name.upper()}' expects a number, not '{flags[name]}'.")
+
+        return int(flags[name])
 
     @staticmethod
-    def autocorrect(string, correction_list, error="does not exist."):
-        autocorrection = get_close_matches(string, correction_list)
+    def relations(model):
+        """
+        Returns the forward relations of a model, mapped to their related models.
+        """
 
-        if not autocorrection or autocorrection[0] != string:
-            suggestion = f"\nDid you mean '{autocorrection[0]}'?" if autocorrection else ""
+        return {
+            name: model._meta.fields_map[name].related_model
+            for name in model._meta.fk_fields | model._meta.o2o_fields
+        }
 
-            raise DexScriptError(f"'{string}' {error}{suggestion}")
+    def relation_paths(self, model, depth, prefix=""):
+        """
+        Returns every relation path of a model up to `depth`, such as `regime__background`,
+        which can be passed to `select_related` to fetch them with a single query.
+        """
 
-        return autocorrection[0]
+        if depth <= 0:
+            return []
 
-    async def create_model(self, model, identifier, yield_creation):
-        fields = {}
+        paths = []
 
-        for key, field in vars(model()).items():
-            if field is not None:
-                continue
+        for name, related_model in self.relations(model).items():
+            paths.append(f"{prefix}{name}")
+            paths += self.relation_paths(related_model, depth - 1, f"{prefix}{name}__")
 
-            if key in ["id", "short_name"]:
-                continue
+        return paths
 
-            fields[key] = 1
+    def render_model(self, instance, depth=0, indent=0):
+        """
+        Formats the fields of a model instance, showing related instances inline
+        until `depth` is reached. Returns the formatted text and any attached files.
 
-            if key in ["country", "full_name", "catch_names", "name"]:
-                fields[key] = identifier
-            elif key == "emoji_id":
-                fields[key] = 100**8
-            elif key == "regime_id":
-                first_regime = await Regime.first()
-                fields[key] = first_regime.pk
+        Parameters
+        ----------
+        instance: Model
+          The instance you want to format.
+        depth: int
+          How many relations deep related instances should be shown.
+        indent: int
+          The indentation level of the fields.
+        """
 
-        if yield_creation:
-            return Yield(model, identifier, fields, YieldType.CREATE_MODEL)
+        if instance is None:
+            return f"{'  ' * indent}None\n", []
 
-        await model.create(**fields)
+        content = ""
+        files = []
+        relations = self.relations(type(instance)) if depth > 0 else {}
 
-    async def get_model(self, model, identifier):
-        try:
-            returned_model = await model.name.filter(
-                **{
-                    self.translate(model.extra_data[0].lower()): self.autocorrect(
-                        identifier, [str(x) for x in await model.name.all()]
+        for key, value in vars(instance).items():
+            if key.startswith("_"):
+                continue
+
+            content += f"{'  ' * indent}{key}: {value}"
+
+            if key.endswith("_id") and key[:-3] in relations:
+                related = getattr(instance, key[:-3])
+
+                content += f" ({related})\n"
+
+                if depth > 1 and related is not None:
+                    related_content, related_files = self.render_model(
+                        related, depth - 1, indent + 1
                     )
-                }
-            )
-        except AttributeError:
-            raise DexScriptError(f"{model} is not a valid model.")
 
-        return returned_model[0]
+                    content += related_content
+                    files += related_files
+
+                continue
+
+            content += "\n"
+
+            if isinstance(value, str) and value.startswith("/static"):
+                files.append(discord.File(value[1:]))
+
+        return content, files
 
     def var(self, value):
         return_value = value
@@ -372,13 +2198,15 @@ class DexScriptParser:
             case Types.MODEL:
                 current_model = MODELS[value.name.lower()]
 
+                value.extra_data += [current_model[1], value.name]
                 value.name = current_model[0]
-                value.extra_data.append(current_model[1])
 
             case Types.BOOLEAN:
                 value.name = value.name.lower() == "true"
 
             case Types.DATETIME:
+                from dateutil.parser import parse as parse_date
+
                 value.name = parse_date(value.name)
 
         return return_value
@@ -403,58 +2231,191 @@ class DexScriptParser:
 
         return getattr(item, translated_string) if item else translated_string
 
-    def create_value(self, line):
-        type = Types.STRING
-
-        value = Value(line, type)
+    def classify(self, line):
         lower = line.lower()
 
         if lower in vars(Methods):
-            type = Types.METHOD
+            return Types.METHOD
         elif lower in MODELS:
-            type = Types.MODEL
+            return Types.MODEL
         elif self.is_date(lower) and lower.count("-") >= 2:
-            type = Types.DATETIME
+            return Types.DATETIME
         elif self.is_number(lower):
-            type = Types.NUMBER
+            return Types.NUMBER
         elif lower in ["true", "false"]:
-            type = Types.BOOLEAN
+            return Types.BOOLEAN
 
-        value.type = type
+        return Types.STRING
 
-        return self.var(value)
+    def create_value(self, line):
+        return self.var(Value(line, self.classify(line)))
+
+    def tokenize(self, code: str) -> list[list[tuple[str, str]]]:
+        """
+        Splits DexScript code into statements of classified tokens.
+
+        Tokens are plain `(string, type name)` pairs, so they can be cached in
+        `compiled_scripts` and survive a reload.
+
+        Parameters
+        ----------
+        code: str
+          The code you want to tokenize.
+        """
+
+        if code in compiled_scripts:
+            compiled_scripts[code] = compiled_scripts.pop(code)
+            return compiled_scripts[code]
+
+        seperator = "\n" if "\n" in code else ";'"
+
+        split_code = [x for x in code.split(seperator) if x.strip() != ""]
+
+        tokenized_code: list[list[tuple[str, str]]] = []
+
+        for line in split_code:
+            line_tokens: list[tuple[str, str]] = []
+            full_line = ""
+
+            for index2, char in enumerate(line):
+                if char == "":
+                    continue
+
+                full_line += char
+
+                if full_line == "--":
+                    break
+
+                if char in [">"] or index2 == len(line) - 1:
+                    token = full_line.replace(">", "").strip()
+                    line_tokens.append((token, self.classify(token).name))
+
+                    full_line = ""
+
+                    if len(line_tokens) == len(line.split(">")):
+                        tokenized_code.append(line_tokens)
+
+        compiled_scripts[code] = tokenized_code
+
+        for key in list(compiled_scripts)[:-COMPILE_CACHE_SIZE]:
+            del compiled_scripts[key]
+
+        return tokenized_code
+
+    def compile(self, code: str) -> list[list[Value]]:
+        """
+        Parses DexScript code into a list of statements, without executing them.
+
+        Parameters
+        ----------
+        code: str
+          The code you want to compile.
+        """
+
+        return [
+            [self.var(Value(token, Types[type_name])) for token, type_name in line]
+            for line in self.tokenize(code)
+        ]
+
+    @staticmethod
+    def format_statement(line: list[Value]):
+        return " > ".join(
+            x.name.__name__.upper() if x.type == Types.MODEL else str(x) for x in line
+        )
+
+    @staticmethod
+    def format_estimate(plan):
+        """
+        Summarizes the output of a database EXPLAIN into its scan type and row estimate.
+
+        Postgres returns a single row whose `QUERY PLAN` column holds the plan as JSON.
+        MySQL returns a row per table with `rows` and `type` columns, and SQLite returns
+        a row per step with a `detail` column.
+        """
 
-    async def execute(self, code: str):
         try:
-            seperator = "\n" if "\n" in code else ";'"
+            rows = [dict(x) for x in plan]
+        except (TypeError, ValueError):
+            return "unavailable"
 
-            split_code = [x for x in code.split(seperator) if x.strip() != ""]
+        if rows == []:
+            return "unavailable"
 
-            parsed_code: list[list[Value]] = []
+        query_plan = rows[0].get("QUERY PLAN", next(iter(rows[0].values()), None))
 
-            for line in split_code:
-                line_code: list[Value] = []
-                full_line = ""
+        if isinstance(query_plan, str) and query_plan.lstrip().startswith("["):
+            try:
+                query_plan = json.loads(query_plan)
+            except ValueError:
+                pass
 
-                for index2, char in enumerate(line):
-                    if char == "":
-                        continue
+        if isinstance(query_plan, list) and query_plan != [] and "Plan" in query_plan[0]:
+            node = query_plan[0]["Plan"]
+            return f"~{node.get('Plan Rows', '?')} rows ({node.get('Node Type', 'unknown scan')})"
+
+        if "rows" in rows[0]:
+            return ", ".join(f"~{x['rows']} rows ({x.get('type', 'unknown scan')})" for x in rows)
+
+        if "detail" in rows[0]:
+            return ", ".join(str(x["detail"]) for x in rows)
+
+        return "unavailable"
+
+    async def explain(self, code: str) -> str:
+        """
+        Plans DexScript code, describing the queries it would issue and their estimated cost.
 
-                    full_line += char
+        Parameters
+        ----------
+        code: str
+          The code you want to explain.
+        """
+
+        content = ""
+
+        for index, line in enumerate(self.compile(code), start=1):
+            content += f"{index}. {self.format_statement(line)}\n"
+
+            args, flags = self.parse_flags(line)
+
+            for value in line[:1]:
+                if value.type != Types.METHOD:
+                    continue
+
+                planner = ScriptPlanner(self, args, flags).plans.get(value.name.lower())
+
+                try:
+                    steps = await planner() if planner else []
+                except IndexError:
+                    steps = [PlanStep(f"Argument is missing when calling {value.name}.")]
+
+                if steps == []:
+                    steps = [PlanStep("No database queries")]
 
-                    if full_line == "--":
-                        break
+                for step in steps:
+                    content += f"   - {step.description}\n"
 
-                    if char in [">"] or index2 == len(line) - 1:
-                        line_code.append(self.create_value(full_line.replace(">", "").strip()))
+                    if step.sql is not None:
+                        content += f"     {step.sql}\n"
+
+                    if step.estimate is not None:
+                        estimate = self.format_estimate(await step.estimate.explain())
+                        content += f"     Estimate: {estimate}\n"
+
+        return content
+
+    async def execute(self, code: str):
+        try:
+            parsed_code = self.compile(code)
 
-                        full_line = ""
+            errors = await ScriptValidator(self).validate(parsed_code)
 
-                        if len(line_code) == len(line.split(">")):
-                            parsed_code.append(line_code)
+            if errors != []:
+                error = "\n".join(errors)
+                return ((error, error), CodeStatus.FAILURE)
 
             for line2 in parsed_code:
-                for value in line2:
+                for value in line2[:1]:
                     if value.type != Types.METHOD:
                         continue
 
@@ -473,6 +2434,175 @@ class DexScriptParser:
         return (None, CodeStatus.SUCCESS)
 
 
+class JobOutput:
+    """
+    Buffers the output of a background job instead of sending it to Discord.
+    """
+
+    def __init__(self):
+        self.lines: list[str] = []
+
+    def done(self) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+
+        return future
+
+    def send(self, _, content=None, **kwargs) -> asyncio.Future:
+        if content is not None:
+            self.lines.append(str(content))
+
+        files = kwargs.get("files", []) + ([kwargs["file"]] if "file" in kwargs else [])
+
+        for file in files:
+            self.lines.append(f"[Attached file: {file.filename}]")
+            file.close()
+
+        return self.done()
+
+    def add_reaction(self, *_) -> asyncio.Future:
+        return self.done()
+
+
+@dataclass
+class Job:
+    id: int
+    ctx: commands.Context
+    code: str
+    status: JobStatus = JobStatus.QUEUED
+    output: JobOutput = datafield(default_factory=JobOutput)
+    error: str | None = None
+    queued_at: float = datafield(default_factory=time.monotonic)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    def timings(self):
+        now = time.monotonic()
+
+        waited = (self.started_at or now) - self.queued_at
+        timings = f"queued {waited:.2f}s"
+
+        if self.started_at is not None:
+            timings += f", ran {(self.finished_at or now) - self.started_at:.2f}s"
+
+        return timings
+
+
+class JobRunner:
+    """
+    Runs DexScript code in the background with a bounded number of workers.
+    """
+
+    def __init__(self, output: OutputQueue):
+        self.output = output
+        self.queue: asyncio.Queue[Job] = asyncio.Queue()
+        self.jobs: dict[int, Job] = {}
+        self.workers: list[asyncio.Task] = []
+        self.busy: set[asyncio.Task] = set()
+        self.next_id = 1
+
+    def submit(self, ctx: commands.Context, code: str) -> Job:
+        """
+        Queues code as a background job and returns it immediately.
+
+        Parameters
+        ----------
+        ctx: commands.Context
+          The context the job was submitted from.
+        code: str
+          The code you want to run.
+        """
+
+        job = Job(self.next_id, ctx, code)
+
+        self.next_id += 1
+        self.jobs[job.id] = job
+
+        for job_id in list(self.jobs)[:-JOB_HISTORY]:
+            if self.jobs[job_id].status in [JobStatus.SUCCESS, JobStatus.FAILURE]:
+                del self.jobs[job_id]
+
+        self.queue.put_nowait(job)
+        self.resize()
+
+        return job
+
+    def resize(self):
+        """
+        Matches the number of workers to the `JOB-WORKERS` setting.
+
+        Idle workers above the limit are cancelled, and busy ones stop after their current job.
+        """
+
+        self.workers = [x for x in self.workers if not x.done()]
+
+        for worker in [x for x in self.workers if x not in self.busy]:
+            if len(self.workers) <= SETTINGS["JOB-WORKERS"]:
+                break
+
+            worker.cancel()
+            self.workers.remove(worker)
+
+        while len(self.workers) < SETTINGS["JOB-WORKERS"]:
+            self.workers.append(asyncio.create_task(self.worker()))
+
+    async def worker(self):
+        task = asyncio.current_task()
+
+        while len(self.workers) <= SETTINGS["JOB-WORKERS"]:
+            job = await self.queue.get()
+            self.busy.add(task)
+
+            job.status = JobStatus.RUNNING
+            job.started_at = time.monotonic()
+
+            try:
+                result, status = await DexScriptParser(job.ctx, job.output).execute(job.code)
+            except Exception as error:
+                result, status = ((error, traceback.format_exc()), CodeStatus.FAILURE)
+
+            job.finished_at = time.monotonic()
+            job.status = JobStatus.SUCCESS
+
+            if status == CodeStatus.FAILURE and result is not None:
+                job.status = JobStatus.FAILURE
+                job.error = str(result[SETTINGS["DEBUG"]])
+
+            self.output.send(
+                job.ctx,
+                f"-# Job `{job.id}` finished with `{job.status.name}` ({job.timings()}). "
+                f"Use `{settings.prefix}ds-job {job.id}` to view its output.",
+            )
+
+            self.busy.discard(task)
+            self.queue.task_done()
+
+        self.workers.remove(task)
+
+    def active(self) -> list[Job]:
+        return [x for x in self.jobs.values() if x.status in [JobStatus.QUEUED, JobStatus.RUNNING]]
+
+    def stop(self):
+        """
+        Cancels every worker, marking unfinished jobs as failed and notifying their channels,
+        since a cancelled job may have only applied some of its writes.
+        """
+
+        for job in self.active():
+            job.status = JobStatus.FAILURE
+            job.error = "Cancelled because DexScript was unloaded."
+            job.finished_at = time.monotonic()
+
+            self.output.send(
+                job.ctx,
+                f"-# Job `{job.id}` was cancelled because DexScript was unloaded "
+                f"({job.timings()}). Some of its writes may have been applied.",
+            )
+
+        for worker in self.workers:
+            worker.cancel()
+
+
 class DexScript(commands.Cog):
     """
     DexScript commands
@@ -480,6 +2610,32 @@ class DexScript(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.output = OutputQueue()
+        self.jobs = JobRunner(self.output)
+
+    async def cog_load(self):
+        global invalidation_bus
+
+        bus_type = BUSES.get(SETTINGS["CACHE-BUS"])
+
+        if bus_type is None:
+            log.error(f"'{SETTINGS['CACHE-BUS']}' is not a valid cache bus, using 'local'")
+            bus_type = InvalidationBus
+
+        invalidation_bus = bus_type()
+
+        try:
+            await invalidation_bus.start()
+        except Exception:
+            log.exception("Failed to start the DexScript cache bus, using 'local'")
+            invalidation_bus = InvalidationBus()
+
+    async def cog_unload(self):
+        self.jobs.stop()
+
+        await invalidation_bus.stop()
+
+        setattr(self.bot, STATE_ATTRIBUTE, export_state())
 
     @staticmethod
     def cleanup_code(content):
@@ -492,11 +2648,23 @@ class DexScript(commands.Cog):
 
         return content.strip("` \n")
 
+    @staticmethod
+    def split_run_flags(code):
+        """
+        Separates the leading flags of a `run` command, such as `-explain`, from its code.
+        """
+
+        match = RUN_FLAGS_RE.match(code.strip())
+
+        return {x[1:].lower() for x in match.group(1).split()}, match.group(2)
+
     @staticmethod
     def check_version():
         if not SETTINGS["OUTDATED-WARNING"]:
             return None
 
+        import requests
+
         r = requests.get(
             "https://api.github.com/repos/Dotsian/DexScript/contents/version.txt",
             {"ref": SETTINGS["REFERENCE"]},
@@ -522,26 +2690,108 @@ class DexScript(commands.Cog):
         """
         Executes DexScript code.
 
+        Flags
+        -----
+        -explain
+          Plans the code and shows the queries it would issue, without executing it.
+        -bg
+          Runs the code as a background job and replies with its job ID.
+
         Parameters
         ----------
         code: str
           The code you'd like to execute.
         """
 
+        flags, code = self.split_run_flags(code)
         body = self.cleanup_code(code)
 
         version_check = self.check_version()
 
         if version_check:
-            await ctx.send(f"-# {version_check}")
+            self.output.send(ctx, f"-# {version_check}")
+
+        dexscript_instance = DexScriptParser(ctx, self.output)
+
+        if "explain" in flags:
+            try:
+                plan = await dexscript_instance.explain(body)
+            except Exception as error:
+                self.output.send(ctx, f"```ERROR: {error}\n```")
+                return
+
+            if len(plan) > MESSAGE_LIMIT - 8:
+                file = discord.File(io.BytesIO(plan.encode("UTF-8")), filename="explain.txt")
+                self.output.send(ctx, "Execution plan:", file=file)
+            else:
+                self.output.send(ctx, f"```\n{plan}```")
+
+            return
+
+        if "bg" in flags:
+            job = self.jobs.submit(ctx, body)
+
+            self.output.send(
+                ctx,
+                f"Queued job `{job.id}`. "
+                f"Use `{settings.prefix}ds-job {job.id}` to view its status.",
+            )
+            return
 
-        dexscript_instance = DexScriptParser(ctx)
         result, status = await dexscript_instance.execute(body)
 
         if status == CodeStatus.FAILURE and result is not None:
-            await ctx.send(f"```ERROR: {result[SETTINGS['DEBUG']]}\n```")
+            self.output.send(ctx, f"```ERROR: {result[SETTINGS['DEBUG']]}\n```")
         else:
-            await ctx.message.add_reaction("✅")
+            self.output.add_reaction(ctx.message, "✅")
+
+    @commands.command(name="ds-jobs")
+    @commands.is_owner()
+    async def ds_jobs(self, ctx: commands.Context):
+        """
+        Lists DexScript background jobs.
+        """
+
+        content = "DEXSCRIPT JOBS:\n\n"
+
+        for job in self.jobs.jobs.values():
+            content += f"{job.id}. {job.status.name} ({job.timings()})\n"
+
+        if self.jobs.jobs == {}:
+            content += "No jobs have been submitted.\n"
+
+        self.output.send(ctx, f"```\n{content[-(MESSAGE_LIMIT - 8) :]}```")
+
+    @commands.command(name="ds-job")
+    @commands.is_owner()
+    async def ds_job(self, ctx: commands.Context, job_id: int):
+        """
+        Displays the status, timings, and buffered output of a background job.
+
+        Parameters
+        ----------
+        job_id: int
+          The ID of the job you want to view.
+        """
+
+        job = self.jobs.jobs.get(job_id)
+
+        if job is None:
+            self.output.send(ctx, f"Job `{job_id}` does not exist.")
+            return
+
+        content = f"JOB {job.id}: {job.status.name} ({job.timings()})\n\n"
+        content += "\n".join(job.output.lines) or "No output."
+
+        if job.error is not None:
+            content += f"\n\nERROR: {job.error}"
+
+        if len(content) > MESSAGE_LIMIT - 8:
+            file = discord.File(io.BytesIO(content.encode("UTF-8")), filename=f"job-{job.id}.txt")
+            self.output.send(ctx, f"Job `{job.id}` output:", file=file)
+            return
+
+        self.output.send(ctx, f"```\n{content}\n```")
 
     @commands.command()
     @commands.is_owner()
@@ -578,6 +2828,8 @@ class DexScript(commands.Cog):
         Updates DexScript to the latest version.
         """
 
+        import requests
+
         r = requests.get(
             "https://api.github.com/repos/Dotsian/DexScript/contents/installer.py",
             {"ref": SETTINGS["REFERENCE"]},
@@ -599,8 +2851,22 @@ class DexScript(commands.Cog):
         Reloads DexScript.
         """
 
+        active = self.jobs.active()
+
+        if active != []:
+            await ctx.send(
+                f"Jobs {format_identifiers(x.id for x in active)} are still queued or running. "
+                "Wait for them to finish before reloading DexScript."
+            )
+            return
+
+        start_time = time.perf_counter()
+
         await self.bot.reload_extension(f"{dir_type}.core.dexscript")
-        await ctx.send("Reloaded DexScript")
+
+        await ctx.send(
+            f"Reloaded DexScript in {round((time.perf_counter() - start_time) * 1000)}ms"
+        )
 
     @commands.command()
     @commands.is_owner()
@@ -623,13 +2889,77 @@ class DexScript(commands.Cog):
 
             if isinstance(selected_setting, bool):
                 SETTINGS[setting] = bool(value)
+            elif isinstance(selected_setting, int):
+                if not value.isdigit() or int(value) < 1:
+                    await ctx.send(f"`{setting}` must be a whole number of at least 1.")
+                    return
+
+                SETTINGS[setting] = int(value)
             elif isinstance(selected_setting, str):
                 SETTINGS[setting] = value
 
+            if setting == "JOB-WORKERS":
+                self.jobs.resize()
+
             response = f"`{setting}` has been set to `{value}`"
 
         await ctx.send(response)
 
 
+def export_state():
+    """
+    Exports DexScript's runtime state as plain data, so it can be handed to the next
+    module instance when DexScript is reloaded.
+    """
+
+    return {
+        "version": __version__,
+        "yields": [
+            (x.model, x.identifier.name, x.identifier.type.name, x.value, x.type.name)
+            for x in dex_yields
+        ],
+        "settings": dict(SETTINGS),
+        "identifier_index": identifier_index,
+        "compiled_scripts": compiled_scripts,
+    }
+
+
+def import_state(state: dict):
+    """
+    Restores runtime state exported by a previous module instance.
+
+    Parameters
+    ----------
+    state: dict
+      The state returned by `export_state`.
+    """
+
+    dex_yields.extend(
+        Yield(model, Value(name, Types[value_type]), value, YieldType[yield_type])
+        for model, name, value_type, value, yield_type in state["yields"]
+    )
+
+    SETTINGS.update({k: v for k, v in state["settings"].items() if k in SETTINGS})
+
+    # Events from other processes are lost while the cache bus is stopped, so the index
+    # can only be trusted when nothing else writes to the database.
+    if SETTINGS["CACHE-BUS"] == "local":
+        identifier_index.update(state["identifier_index"])
+
+    # Cached tokens are classified by verb, which can change between versions.
+    if state["version"] == __version__:
+        compiled_scripts.update(state["compiled_scripts"])
+
+
 async def setup(bot):
+    state = getattr(bot, STATE_ATTRIBUTE, None)
+
+    if state is not None:
+        delattr(bot, STATE_ATTRIBUTE)
+
+        try:
+            import_state(state)
+        except Exception:
+            log.exception("Failed to restore DexScript's state after reloading")
+
     await bot.add_cog(DexScript(bot))